@@ -4,27 +4,33 @@ Add Arabic vocabulary words to Anki using AnkiConnect.
 Adds 5 random words per day (10 cards: Arabic->English and English->Arabic).
 """
 
+import functools
 import json
-import urllib.request
-import urllib.error
+import http.client
+import orjson
 import sys
 import random
 import subprocess
+import threading
 import time
 import os
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Tuple
 
 # Configuration
 WORDS_PER_DAY = 10
 DECK_NAME = "Arabic"
+MODEL_NAME = "Arabic-Bidirectional-v2"
+MULTI_BATCH_SIZE = 20  # words per multi request when pipelining large runs
+MULTI_MAX_IN_FLIGHT = 4  # concurrent multi requests
 REMAINING_WORDS_FILE = Path(__file__).parent / "remaining_words.json"
 BACKUP_FILE = Path(__file__).parent / "levantine_vocabulary.json"
 LOG_FILE = Path(__file__).parent / "notifs.log"
 CSS_FILE = Path(__file__).parent / "anki_card_style.css"
-ANKI_CONNECT_URL = "http://localhost:8765"
-ANKI_STARTUP_WAIT = 5  # seconds to wait for Anki to start
-AUDIO_DIR = Path(__file__).parent / "audio"
+ANKI_CONNECT_HOST = "localhost"
+ANKI_CONNECT_PORT = 8765
+AUDIO_DIR = (Path(__file__).parent / "audio").resolve()
 
 def send_notification(title: str, message: str, urgency: str = "normal") -> None:
     """Send desktop notification using notify-send."""
@@ -42,10 +48,18 @@ def send_notification(title: str, message: str, urgency: str = "normal") -> None
         pass  # Silently fail if notify-send is not available
 
 def is_anki_running() -> bool:
-    """Check if Anki process is running."""
+    """Check if Anki process is running by scanning /proc (no pgrep fork)."""
     try:
-        result = subprocess.run(["pgrep", "-x", "anki"], capture_output=True)
-        return result.returncode == 0
+        for entry in os.scandir("/proc"):
+            if not entry.name.isdigit():
+                continue
+            try:
+                with open(f"/proc/{entry.name}/comm", "r") as f:
+                    if f.read().rstrip("\n") == "anki":
+                        return True
+            except OSError:
+                continue  # Process exited mid-scan
+        return False
     except Exception:
         return False
 
@@ -54,8 +68,12 @@ def is_ankiconnect_ready() -> bool:
     """Check if AnkiConnect API is responding."""
     try:
         request_data = json.dumps({"action": "version", "version": 6}).encode("utf-8")
-        req = urllib.request.Request(ANKI_CONNECT_URL, request_data)
-        urllib.request.urlopen(req, timeout=1).read()
+        conn = http.client.HTTPConnection(ANKI_CONNECT_HOST, ANKI_CONNECT_PORT, timeout=1)
+        try:
+            conn.request("POST", "/", body=request_data)
+            conn.getresponse().read()
+        finally:
+            conn.close()
         return True
     except Exception:
         return False
@@ -79,15 +97,21 @@ def start_anki() -> Optional[subprocess.Popen]:
             stderr=subprocess.DEVNULL
         )
 
-        # Wait for AnkiConnect to be ready
-        for i in range(30):  # Try for 30 seconds
-            time.sleep(1)
-            if is_ankiconnect_ready():
+        # Wait for AnkiConnect with exponential backoff - ready in ~1-2 s on
+        # warm starts instead of always paying whole-second sleeps. deckNames
+        # raises until the server is up AND the collection is loaded, the
+        # condition the old fixed post-startup sleep guarded against in
+        # offscreen mode, so retry it until it succeeds.
+        deadline = time.monotonic() + 60
+        delay = 0.1
+        while time.monotonic() < deadline:
+            try:
+                invoke_anki("deckNames")
                 print(f"Anki started successfully (PID: {process.pid})")
-                # Give Anki extra time to fully initialize in offscreen mode
-                print("Waiting for Anki to fully initialize...")
-                time.sleep(5)
                 return process
+            except Exception:
+                time.sleep(delay)
+                delay = min(delay * 1.5, 1.0)
 
         print("Warning: Anki started but AnkiConnect may not be ready")
         return process
@@ -110,33 +134,71 @@ def stop_anki() -> None:
         print(f"Note: Could not sync/close Anki gracefully: {e}")
 
 
+# Persistent keep-alive connections to AnkiConnect, one per thread so
+# pipelined multi batches never share a socket (lazily opened, reused across calls)
+_anki_connections = threading.local()
+
+
+def _get_anki_connection() -> http.client.HTTPConnection:
+    """Return this thread's AnkiConnect connection, opening it if needed."""
+    if getattr(_anki_connections, "conn", None) is None:
+        _anki_connections.conn = http.client.HTTPConnection(ANKI_CONNECT_HOST, ANKI_CONNECT_PORT, timeout=10)
+    return _anki_connections.conn
+
+
+def _close_anki_connection() -> None:
+    """Close this thread's AnkiConnect connection so the next call reopens it."""
+    conn = getattr(_anki_connections, "conn", None)
+    if conn is not None:
+        conn.close()
+        _anki_connections.conn = None
+
+
 def invoke_anki(action: str, **params) -> Any:
-    """Call AnkiConnect API."""
-    request_data = json.dumps({"action": action, "version": 6, "params": params}).encode("utf-8")
+    """Call AnkiConnect API over a persistent keep-alive connection."""
+    # Compact separators and raw UTF-8: \uXXXX escapes would blow up the
+    # Arabic-heavy batched payloads ~6x
+    request_data = json.dumps(
+        {"action": action, "version": 6, "params": params},
+        ensure_ascii=False,
+        separators=(",", ":")
+    ).encode("utf-8")
 
     try:
-        req = urllib.request.Request(ANKI_CONNECT_URL, request_data)
-        response = urllib.request.urlopen(req, timeout=10).read().decode("utf-8")
+        # Retry once: the server may have closed the idle keep-alive connection
+        for attempt in range(2):
+            conn = _get_anki_connection()
+            try:
+                conn.request("POST", "/", body=request_data)
+                response = conn.getresponse().read().decode("utf-8")
+                break
+            except (http.client.RemoteDisconnected, BrokenPipeError, ConnectionResetError):
+                _close_anki_connection()
+                if attempt == 1:
+                    raise
+
         result = json.loads(response)
 
         if result.get("error"):
             raise Exception(f"AnkiConnect error: {result['error']}")
 
         return result.get("result")
-    except urllib.error.URLError as e:
+    except OSError as e:
+        _close_anki_connection()
         raise Exception(f"Failed to connect to AnkiConnect: {e}")
 
 
-def ensure_deck_exists(deck_name: str) -> None:
-    """Create deck if it doesn't exist."""
-    decks = invoke_anki("deckNames")
-    if deck_name not in decks:
-        invoke_anki("createDeck", deck=deck_name)
-        print(f"Created deck: {deck_name}")
+def create_deck_action(deck_name: str, existing_decks: List[str]) -> Optional[Dict[str, Any]]:
+    """Build a createDeck action if the deck is missing, else None."""
+    if deck_name in existing_decks:
+        return None
+    print(f"Creating deck: {deck_name}")
+    return {"action": "createDeck", "version": 6, "params": {"deck": deck_name}}
 
 
+@functools.lru_cache(maxsize=1)
 def load_css() -> str:
-    """Load CSS from external file."""
+    """Load CSS from external file (read at most once per process)."""
     try:
         with open(CSS_FILE, "r", encoding="utf-8") as f:
             return f.read()
@@ -144,64 +206,62 @@ def load_css() -> str:
         raise Exception(f"CSS file not found: {CSS_FILE}")
 
 
-def store_audio_file(audio_index: int) -> str:
-    """Store audio file in Anki's media collection and return HTML audio element."""
-    import base64
+def store_audio_action(audio_index: int) -> Tuple[Optional[Dict[str, Any]], str]:
+    """Build a storeMediaFile action for the multi batch and the HTML audio element.
 
+    Returns (action, audio_tag); action is None if the audio file is missing.
+    """
     # Format: index 1 → 001.mp3, index 2 → 002.mp3, etc.
     audio_filename = f"{audio_index:03d}.mp3"
     audio_path = AUDIO_DIR / audio_filename
 
     if not audio_path.exists():
         print(f"Warning: Audio file not found: {audio_filename}")
-        return ""
-
-    # Read and encode audio file
-    with open(audio_path, 'rb') as f:
-        audio_data = base64.b64encode(f.read()).decode('utf-8')
-
-    # Store in Anki's media collection
-    invoke_anki("storeMediaFile", filename=audio_filename, data=audio_data)
-
-    # Return HTML audio element (manual playback, no auto-play)
-    return f'<audio src="{audio_filename}" controls preload="metadata"></audio>'
-
-
-def get_model_name() -> str:
-    """Get or create the note type for Arabic cards with two templates."""
-    model_name = "Arabic-Bidirectional-v2"
-    models = invoke_anki("modelNames")
-
-    if model_name not in models:
-        print(f"Creating note type '{model_name}'...")
-        try:
-            css = load_css()
-
-            # Create a new model with FOUR fields and TWO card templates
-            result = invoke_anki(
-                "createModel",
-                modelName=model_name,
-                inOrderFields=["English", "Arabic", "Pronunciation", "Audio"],
-                css=css,
-                cardTemplates=[
-                    {
-                        "Name": "English → Arabic",
-                        "Front": '<div class="english">{{English}}</div>',
-                        "Back": '{{FrontSide}}<hr id="answer"><div class="arabic">{{Arabic}}</div><div class="pronunciation">{{Pronunciation}}</div><div class="audio">{{Audio}}</div>'
-                    },
-                    {
-                        "Name": "Arabic → English",
-                        "Front": '<div class="arabic">{{Arabic}}</div><div class="audio">{{Audio}}</div>',
-                        "Back": '{{FrontSide}}<hr id="answer"><div class="english">{{English}}</div><div class="pronunciation">{{Pronunciation}}</div>'
-                    }
-                ]
-            )
-            print(f"✓ Note type created: {model_name}")
-        except Exception as e:
-            print(f"Error creating note type: {e}")
-            raise
-
-    return model_name
+        return None, ""
+
+    # Pass the absolute path and let Anki copy the file directly -
+    # avoids reading + base64-encoding every mp3 (4/3x payload blow-up)
+    # Sub-actions need "version" so multi wraps results in {"result", "error"}
+    action = {
+        "action": "storeMediaFile",
+        "version": 6,
+        "params": {"filename": audio_filename, "path": str(audio_path)}
+    }
+
+    # HTML audio element (manual playback, no auto-play)
+    return action, f'<audio src="{audio_filename}" controls preload="metadata"></audio>'
+
+
+def create_model_action(model_name: str, existing_models: List[str]) -> Optional[Dict[str, Any]]:
+    """Build a createModel action for the Arabic note type if it is missing, else None."""
+    if model_name in existing_models:
+        return None
+
+    print(f"Creating note type '{model_name}'...")
+    css = load_css()
+
+    # Create a new model with FOUR fields and TWO card templates
+    return {
+        "action": "createModel",
+        "version": 6,
+        "params": {
+            "modelName": model_name,
+            "inOrderFields": ["English", "Arabic", "Pronunciation", "Audio"],
+            "css": css,
+            "cardTemplates": [
+                {
+                    "Name": "English → Arabic",
+                    "Front": '<div class="english">{{English}}</div>',
+                    "Back": '{{FrontSide}}<hr id="answer"><div class="arabic">{{Arabic}}</div><div class="pronunciation">{{Pronunciation}}</div><div class="audio">{{Audio}}</div>'
+                },
+                {
+                    "Name": "Arabic → English",
+                    "Front": '<div class="arabic">{{Arabic}}</div><div class="audio">{{Audio}}</div>',
+                    "Back": '{{FrontSide}}<hr id="answer"><div class="english">{{English}}</div><div class="pronunciation">{{Pronunciation}}</div>'
+                }
+            ]
+        }
+    }
 
 
 def initialize_remaining_words() -> None:
@@ -217,35 +277,40 @@ def initialize_remaining_words() -> None:
 
 def load_remaining_words() -> List[Dict[str, str]]:
     """Load remaining words from JSON file."""
-    with open(REMAINING_WORDS_FILE, "r", encoding="utf-8") as f:
-        return json.load(f)
+    with open(REMAINING_WORDS_FILE, "rb") as f:
+        return orjson.loads(f.read())
 
 
 def save_remaining_words(words: List[Dict[str, str]]) -> None:
-    """Save remaining words back to JSON file."""
-    with open(REMAINING_WORDS_FILE, "w", encoding="utf-8") as f:
-        json.dump(words, f, indent=2, ensure_ascii=False)
-
-
-def add_note(deck: str, model: str, english: str, arabic: str, pronunciation: str, audio: str) -> None:
-    """Add a single note to Anki (creates 2 cards automatically via templates)."""
-    invoke_anki(
-        "addNote",
-        note={
-            "deckName": deck,
-            "modelName": model,
-            "fields": {
-                "English": english,
-                "Arabic": arabic,
-                "Pronunciation": pronunciation,
-                "Audio": audio
-            },
-            "options": {
-                "allowDuplicate": False
-            },
-            "tags": ["arabic", "levantine"]
+    """Save remaining words back to JSON file (atomic write via temp file + rename)."""
+    data = orjson.dumps(words, option=orjson.OPT_INDENT_2)
+    tmp_path = REMAINING_WORDS_FILE.with_suffix(".tmp")
+    tmp_path.write_bytes(data)
+    os.replace(tmp_path, REMAINING_WORDS_FILE)
+
+
+def add_note_action(deck: str, model: str, english: str, arabic: str, pronunciation: str, audio: str) -> Dict[str, Any]:
+    """Build an addNote action for the multi batch (each note creates 2 cards via templates)."""
+    return {
+        "action": "addNote",
+        "version": 6,
+        "params": {
+            "note": {
+                "deckName": deck,
+                "modelName": model,
+                "fields": {
+                    "English": english,
+                    "Arabic": arabic,
+                    "Pronunciation": pronunciation,
+                    "Audio": audio
+                },
+                "options": {
+                    "allowDuplicate": False
+                },
+                "tags": ["arabic", "levantine"]
+            }
         }
-    )
+    }
 
 
 def main():
@@ -254,31 +319,9 @@ def main():
     started_anki = False
 
     try:
-        # Check if Anki is running, start if needed
-        if is_ankiconnect_ready():
-            print("Anki is already running")
-        elif is_anki_running():
-            print("Anki process found, waiting for AnkiConnect...")
-            # Give it some time to fully start
-            for i in range(10):
-                time.sleep(1)
-                if is_ankiconnect_ready():
-                    break
-        else:
-            print("Anki is not running")
-            anki_process = start_anki()
-            started_anki = True
-
-        # Verify AnkiConnect is available
-        version = invoke_anki("version")
-        print(f"Connected to AnkiConnect (version {version})")
-
-        # Setup
-        ensure_deck_exists(DECK_NAME)
-        model_name = get_model_name()
+        # Load remaining words first - if nothing is left to add, skip
+        # the whole Anki startup (the dominant cost of a no-op run)
         initialize_remaining_words()
-
-        # Load remaining words
         remaining_words = load_remaining_words()
 
         # Validate that all words have index field
@@ -294,45 +337,134 @@ def main():
             send_notification("Arabic Learning Complete!", msg, "normal")
             return
 
-        # Select random words
+        # Check if Anki is running, start if needed
+        if is_ankiconnect_ready():
+            print("Anki is already running")
+        elif is_anki_running():
+            print("Anki process found, waiting for AnkiConnect...")
+            # Give it some time to fully start
+            for i in range(10):
+                time.sleep(1)
+                if is_ankiconnect_ready():
+                    break
+        else:
+            print("Anki is not running")
+            anki_process = start_anki()
+            started_anki = True
+
+        # Verify AnkiConnect is available and fetch deck/model inventory in one round-trip
+        version_sub, decks_sub, models_sub = invoke_anki("multi", actions=[
+            {"action": "version", "version": 6},
+            {"action": "deckNames", "version": 6},
+            {"action": "modelNames", "version": 6},
+        ])
+        for sub_result in (version_sub, decks_sub, models_sub):
+            if sub_result.get("error"):
+                raise Exception(f"AnkiConnect error: {sub_result['error']}")
+        print(f"Connected to AnkiConnect (version {version_sub['result']})")
+
+        # Decide locally what setup is missing; send creations in one follow-up batch
+        setup_actions = [
+            action for action in (
+                create_deck_action(DECK_NAME, decks_sub["result"]),
+                create_model_action(MODEL_NAME, models_sub["result"]),
+            ) if action
+        ]
+        if setup_actions:
+            for sub_result in invoke_anki("multi", actions=setup_actions):
+                if sub_result.get("error"):
+                    raise Exception(f"AnkiConnect error: {sub_result['error']}")
+
+        model_name = MODEL_NAME
+
+        # Select random words by list position - sampling small ints instead
+        # of dicts keeps the later removal a pure set-membership pass
         num_to_add = min(WORDS_PER_DAY, len(remaining_words))
-        selected_words = random.sample(remaining_words, num_to_add)
+        selected_positions = random.sample(range(len(remaining_words)), num_to_add)
+        selected_words = [remaining_words[i] for i in selected_positions]
 
         print(f"Randomly selected {num_to_add} words from {len(remaining_words)} remaining")
         print("-" * 50)
 
-        # Add notes (each note creates 2 cards via templates)
+        # Build the batched storeMediaFile + addNote actions, grouped per word
+        # so a word's media store always lands in the same multi request as
+        # its note (collapses 2 HTTP round-trips per word into a single request)
+        word_groups: List[Tuple[int, Dict[str, str], List[Dict[str, Any]]]] = []
+
+        for list_pos, word in zip(selected_positions, selected_words):
+            word_actions: List[Dict[str, Any]] = []
+            audio_action, audio_tag = store_audio_action(word["index"])
+            if audio_action:
+                word_actions.append(audio_action)
+
+            # One note creates 2 cards: English→Arabic and Arabic→English
+            word_actions.append(add_note_action(
+                DECK_NAME, model_name,
+                word["english"], word["arabic"], word["pronunciation"], audio_tag
+            ))
+            word_groups.append((list_pos, word, word_actions))
+
+        # Pipeline the multi requests: sub-batches of MULTI_BATCH_SIZE words
+        # with several in flight, so large first-run migrations keep the
+        # AnkiConnect queue busy. A daily run still fits in one request.
+        batches = [
+            word_groups[i:i + MULTI_BATCH_SIZE]
+            for i in range(0, len(word_groups), MULTI_BATCH_SIZE)
+        ]
+
+        def send_batch(batch):
+            batch_actions = [action for _, _, group in batch for action in group]
+            return invoke_anki("multi", actions=batch_actions)
+
+        with ThreadPoolExecutor(max_workers=MULTI_MAX_IN_FLIGHT) as executor:
+            batch_results = list(executor.map(send_batch, batches))
+
+        # Check each addNote result positionally (multi returns {"result", "error"} per sub-action)
         cards_added = 0
         successfully_added = []
-
-        for word in selected_words:
-            english = word["english"]
-            arabic = word["arabic"]
-            pronunciation = word["pronunciation"]
-            audio_index = word["index"]
-
-            try:
-                # Store audio file and get [sound:...] tag
-                audio_tag = store_audio_file(audio_index)
-
-                # Add one note (creates 2 cards: English→Arabic and Arabic→English)
-                add_note(DECK_NAME, model_name, english, arabic, pronunciation, audio_tag)
-                cards_added += 2  # One note creates 2 cards
-
-                print(f"✓ Added: {english} ({pronunciation}) ↔ {arabic} [Audio: {audio_index:03d}.mp3]")
-                successfully_added.append(word)
-
-            except Exception as e:
-                if "duplicate" in str(e).lower():
+        added_positions = set()
+
+        for batch, results in zip(batches, batch_results):
+            pos = 0
+            for list_pos, word, word_actions in batch:
+                english = word["english"]
+                arabic = word["arabic"]
+                pronunciation = word["pronunciation"]
+                audio_index = word["index"]
+
+                group_results = results[pos:pos + len(word_actions)]
+                pos += len(word_actions)
+
+                # A failed media store would leave the note's <audio> tag
+                # pointing at nothing - treat it as a hard error, like the
+                # pre-batching code did
+                for store_result in group_results[:-1]:
+                    store_error = store_result.get("error") if isinstance(store_result, dict) else None
+                    if store_error:
+                        raise Exception(f"AnkiConnect error storing {audio_index:03d}.mp3: {store_error}")
+
+                # Last action of the group is the word's addNote
+                sub_result = group_results[-1]
+                error = sub_result.get("error") if isinstance(sub_result, dict) else None
+
+                if error is None:
+                    cards_added += 2  # One note creates 2 cards
+                    print(f"✓ Added: {english} ({pronunciation}) ↔ {arabic} [Audio: {audio_index:03d}.mp3]")
+                    successfully_added.append(word)
+                    added_positions.add(list_pos)
+                elif "duplicate" in error.lower():
                     print(f"⊘ Skipped (duplicate): {english} ↔ {arabic}")
                     # Still mark as successfully processed (remove from remaining)
                     successfully_added.append(word)
+                    added_positions.add(list_pos)
                 else:
-                    raise
+                    raise Exception(f"AnkiConnect error: {error}")
 
-        # Remove successfully added words from remaining_words
-        for word in successfully_added:
-            remaining_words.remove(word)
+        # Drop successfully added words by their sampled list positions -
+        # one O(N) rebuild with O(1) membership tests, no dict comparisons
+        remaining_words = [
+            word for i, word in enumerate(remaining_words) if i not in added_positions
+        ]
 
         save_remaining_words(remaining_words)
 
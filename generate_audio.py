@@ -3,11 +3,14 @@
 Generate Arabic audio files for Levantine vocabulary using ElevenLabs.
 """
 
-import json
+import orjson
 import os
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
 from dotenv import load_dotenv
 from elevenlabs.client import ElevenLabs
+from tqdm import tqdm
 
 # Configuration
 VOCAB_FILE = Path(__file__).parent / "levantine_vocabulary.json"
@@ -15,11 +18,52 @@ OUTPUT_DIR = Path(__file__).parent / "audio"
 VOICE_ID = "drMurExmkWVIH5nW8snR"
 MODEL_ID = "eleven_flash_v2_5"
 OUTPUT_FORMAT = "mp3_44100_128"  # 128kbps mp3
+MAX_WORKERS = 8  # concurrent TTS requests (keep below ElevenLabs rate limits)
+RATE_LIMIT_RETRIES = 3  # retries per word on HTTP 429
 
 def load_vocabulary():
     """Load vocabulary from JSON file."""
-    with open(VOCAB_FILE, 'r', encoding='utf-8') as f:
-        return json.load(f)
+    with open(VOCAB_FILE, 'rb') as f:
+        return orjson.loads(f.read())
+
+def generate_one(client, arabic_text, output_path):
+    """Generate one audio file, writing it atomically (.tmp then rename)."""
+    # Voice settings for consistent vocabulary pronunciation
+    voice_settings = {
+        "stability": 1.0,  # Maximum stability, no drama
+        "style": 0.0,      # No style exaggeration
+    }
+
+    for attempt in range(RATE_LIMIT_RETRIES + 1):
+        try:
+            # Generate audio
+            audio = client.text_to_speech.convert(
+                text=arabic_text,
+                voice_id=VOICE_ID,
+                model_id=MODEL_ID,
+                output_format=OUTPUT_FORMAT,
+                voice_settings=voice_settings,
+            )
+            break
+        except Exception as e:
+            # Back off and retry on rate limiting, fail otherwise
+            if "429" in str(e) and attempt < RATE_LIMIT_RETRIES:
+                time.sleep(2 ** attempt)
+            else:
+                raise
+
+    # Write to a temp file first so a crash never leaves a partial mp3
+    tmp_path = output_path.with_suffix('.tmp')
+    with open(tmp_path, 'wb') as f:
+        # Handle both bytes and generator responses; stream generator
+        # chunks straight to disk instead of buffering the whole file
+        if isinstance(audio, (bytes, bytearray)):
+            f.write(audio)
+        else:
+            for chunk in audio:
+                f.write(chunk)
+    os.replace(tmp_path, output_path)
+
 
 def generate_audio_files():
     """Generate audio files for all vocabulary words."""
@@ -51,50 +95,36 @@ def generate_audio_files():
     failed = 0
     skipped = 0
 
+    # Skip files that already exist, queue the rest
+    pending = []
     for idx, entry in enumerate(vocab, start=1):
-        arabic_text = entry['arabic']
-        filename = f"{idx:03d}.mp3"
-        output_path = OUTPUT_DIR / filename
-
-        # Skip if file already exists
+        output_path = OUTPUT_DIR / f"{idx:03d}.mp3"
         if output_path.exists():
-            print(f"[{idx:03d}/{total}] Skipping (already exists): {arabic_text}")
             skipped += 1
-            continue
-
-        try:
-            # Voice settings for consistent vocabulary pronunciation
-            voice_settings = {
-                "stability": 1.0,  # Maximum stability, no drama
-                "style": 0.0,      # No style exaggeration
-            }
-
-            # Generate audio
-            audio = client.text_to_speech.convert(
-                text=arabic_text,
-                voice_id=VOICE_ID,
-                model_id=MODEL_ID,
-                output_format=OUTPUT_FORMAT,
-                voice_settings=voice_settings,
-            )
-
-            # Handle both bytes and generator responses
-            if isinstance(audio, bytes):
-                audio_data = audio
-            else:
-                # Generator - collect all chunks
-                audio_data = b"".join(audio)
-
-            # Save to file
-            with open(output_path, 'wb') as f:
-                f.write(audio_data)
-
-            print(f"[{idx:03d}/{total}] Generated: {arabic_text} -> {filename}")
-            successful += 1
-
-        except Exception as e:
-            print(f"[{idx:03d}/{total}] FAILED: {arabic_text} - {str(e)}")
-            failed += 1
+        else:
+            pending.append((idx, entry))
+
+    if skipped:
+        print(f"Skipping {skipped} words with existing audio files")
+
+    # Generate concurrently - each worker blocks on its own TTS request,
+    # so wall-clock time is bounded by latency, not word count. Progress
+    # goes through a rate-limited tqdm bar instead of a print per word,
+    # keeping stdout syscalls bounded under parallel completion.
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+        futures = {
+            executor.submit(generate_one, client, entry['arabic'], OUTPUT_DIR / f"{idx:03d}.mp3"): (idx, entry)
+            for idx, entry in pending
+        }
+
+        for future in tqdm(as_completed(futures), total=len(futures), unit="word", mininterval=0.5):
+            idx, entry = futures[future]
+            try:
+                future.result()
+                successful += 1
+            except Exception as e:
+                tqdm.write(f"[{idx:03d}/{total}] FAILED: {entry['arabic']} - {str(e)}")
+                failed += 1
 
     # Summary
     print("-" * 60)